@@ -315,6 +315,7 @@ class AgentLoop:
     def stop(self) -> None:
         """Stop the agent loop."""
         self._running = False
+        self.sessions.flush()
         logger.info("Agent loop stopping")
     
     async def _process_message(
@@ -328,6 +328,8 @@ def gateway(
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Verbose output"),
 ):
     """Start the nanobot gateway."""
+    from functools import lru_cache
+
     from nanobot.config.loader import load_config, get_data_dir
     from nanobot.bus.queue import MessageBus
     from nanobot.agent.loop import AgentLoop
@@ -345,53 +347,37 @@ def gateway(
     
     config = load_config()
     bus = MessageBus()
-    provider = _make_provider(config)
     session_manager = SessionManager(config.workspace_path)
     heartbeat_model = config.heartbeat.model.strip() or config.agents.defaults.model
-    heartbeat_provider = provider if heartbeat_model == config.agents.defaults.model else _make_provider(config, model=heartbeat_model)
     
     # Create cron service first (callback set after agent creation)
     cron_store_path = get_data_dir() / "cron" / "jobs.json"
     cron = CronService(cron_store_path)
     
-    # Create agent with cron service
-    agent = AgentLoop(
-        bus=bus,
-        provider=provider,
-        workspace=config.workspace_path,
-        model=config.agents.defaults.model,
-        temperature=config.agents.defaults.temperature,
-        max_tokens=config.agents.defaults.max_tokens,
-        max_iterations=config.agents.defaults.max_tool_iterations,
-        memory_window=config.agents.defaults.memory_window,
-        memory_consolidation_interval=config.agents.defaults.memory_consolidation_interval,
-        memory_auto_update_long_term=config.agents.defaults.memory_auto_update_long_term,
-        brave_api_key=config.tools.web.search.api_key or None,
-        exec_config=config.tools.exec,
-        cron_service=cron,
-        restrict_to_workspace=config.tools.restrict_to_workspace,
-        session_manager=session_manager,
-        mcp_servers=config.tools.mcp_servers,
-    )
+    # One agent per distinct model: heartbeat shares the main agent unless it uses its own model
+    @lru_cache(maxsize=None)
+    def agent_for(model: str) -> AgentLoop:
+        return AgentLoop(
+            bus=bus,
+            provider=_make_provider(config, model=model),
+            workspace=config.workspace_path,
+            model=model,
+            temperature=config.agents.defaults.temperature,
+            max_tokens=config.agents.defaults.max_tokens,
+            max_iterations=config.agents.defaults.max_tool_iterations,
+            memory_window=config.agents.defaults.memory_window,
+            memory_consolidation_interval=config.agents.defaults.memory_consolidation_interval,
+            memory_auto_update_long_term=config.agents.defaults.memory_auto_update_long_term,
+            brave_api_key=config.tools.web.search.api_key or None,
+            exec_config=config.tools.exec,
+            cron_service=cron,
+            restrict_to_workspace=config.tools.restrict_to_workspace,
+            session_manager=session_manager,
+            mcp_servers=config.tools.mcp_servers,
+        )
 
-    heartbeat_agent = agent if heartbeat_model == config.agents.defaults.model else AgentLoop(
-        bus=bus,
-        provider=heartbeat_provider,
-        workspace=config.workspace_path,
-        model=heartbeat_model,
-        temperature=config.agents.defaults.temperature,
-        max_tokens=config.agents.defaults.max_tokens,
-        max_iterations=config.agents.defaults.max_tool_iterations,
-        memory_window=config.agents.defaults.memory_window,
-        memory_consolidation_interval=config.agents.defaults.memory_consolidation_interval,
-        memory_auto_update_long_term=config.agents.defaults.memory_auto_update_long_term,
-        brave_api_key=config.tools.web.search.api_key or None,
-        exec_config=config.tools.exec,
-        cron_service=cron,
-        restrict_to_workspace=config.tools.restrict_to_workspace,
-        session_manager=session_manager,
-        mcp_servers=config.tools.mcp_servers,
-    )
+    agent = agent_for(config.agents.defaults.model)
+    heartbeat_agent = agent_for(heartbeat_model)
     
     # Set cron callback (needs agent)
     async def on_cron_job(job: CronJob) -> str | None:
@@ -538,6 +524,7 @@ def agent(
                 response = await agent_loop.process_direct(message, session_id, on_progress=_cli_progress)
             _print_agent_response(response, render_markdown=markdown)
             await agent_loop.close_mcp()
+            agent_loop.sessions.flush()
         
         asyncio.run(run_once())
     else:
@@ -548,6 +535,7 @@ def agent(
         def _exit_on_sigint(signum, frame):
             _restore_terminal()
             console.print("\nGoodbye!")
+            agent_loop.sessions.flush()
             os._exit(0)
 
         signal.signal(signal.SIGINT, _exit_on_sigint)
@@ -580,6 +568,7 @@ def agent(
                         break
             finally:
                 await agent_loop.close_mcp()
+                agent_loop.sessions.flush()
         
         asyncio.run(run_interactive())
 
@@ -233,7 +233,7 @@ class GatewayConfig(Base):
     port: int = 18790
 
 
-class HeartbeatConfig(BaseModel):
+class HeartbeatConfig(Base):
     """Heartbeat service configuration."""
 
     interval_s: int = 30 * 60  # 30 minutes by default
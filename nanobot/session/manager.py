@@ -1,17 +1,60 @@
 """Session management for conversation history."""
 
-import json
+import os
+import shutil
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any
+from functools import lru_cache
+from typing import Any, BinaryIO
 
+import orjson
 from loguru import logger
 
 from nanobot.utils.helpers import ensure_dir, safe_filename
 
+# fdatasync skips the metadata flush but is missing on macOS and Windows
+_fdatasync = getattr(os, "fdatasync", os.fsync)
 
-@dataclass
+# Message fields passed through to the LLM; timestamps and bookkeeping are dropped
+_HISTORY_KEYS = ("role", "content", "tool_calls", "tool_call_id", "name", "reasoning_content")
+
+
+def _encode_lines(messages: list[dict[str, Any]]) -> bytes:
+    """Encode messages as JSONL in a single buffer so a flush is one write() call."""
+    # orjson emits UTF-8 bytes directly, so non-ASCII text stays readable on disk,
+    # and appends the newline itself rather than via a second bytes concatenation
+    return b"".join([orjson.dumps(msg, option=orjson.OPT_APPEND_NEWLINE) for msg in messages])
+
+
+def _epoch_ns(dt: datetime) -> int:
+    """Convert a datetime to epoch nanoseconds; naive values are taken as local time."""
+    return round(dt.timestamp() * 1_000_000) * 1_000
+
+
+def _message_time_ns(message: dict[str, Any]) -> int:
+    """Return a message's epoch time, falling back to its ISO timestamp for older messages."""
+    ts_ns = message.get("ts_ns")
+    if ts_ns is not None:
+        return ts_ns
+    try:
+        return _epoch_ns(datetime.fromisoformat(message["timestamp"]))
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+
+@lru_cache(maxsize=256)
+def _session_paths(directory: Path, key: str) -> tuple[Path, Path]:
+    """Return the (messages, metadata sidecar) paths for a session key, memoized per directory."""
+    safe_key = safe_filename(key.replace(":", "_"))
+    return directory / f"{safe_key}.jsonl", directory / f"{safe_key}.meta.json"
+
+
+@dataclass(slots=True)
 class Session:
     """
     A conversation session.
@@ -29,73 +72,122 @@ class Session:
     updated_at: datetime = field(default_factory=datetime.now)
     metadata: dict[str, Any] = field(default_factory=dict)
     last_consolidated: int = 0  # Number of messages already consolidated to files
+    _saved_count: int = field(default=0, init=False, repr=False, compare=False)  # Messages already on disk
+    _saved_size: int = field(default=0, init=False, repr=False, compare=False)  # Bytes already on disk
+    _rewrite: bool = field(default=False, init=False, repr=False, compare=False)  # Next save rewrites the file
+    _anchor_indices: list[int] = field(default_factory=list, init=False, repr=False, compare=False)
+    _anchor_times: list[int] = field(default_factory=list, init=False, repr=False, compare=False)  # Epoch ns
+    _anchor_times_sorted: bool = field(default=True, init=False, repr=False, compare=False)
+    _indexed_count: int = field(default=0, init=False, repr=False, compare=False)
+    _indexed_messages: list[dict[str, Any]] | None = field(default=None, init=False, repr=False, compare=False)
     
     def add_message(self, role: str, content: str, **kwargs: Any) -> None:
         """Add a message to the session."""
+        ts_ns = time.time_ns()
+        now = datetime.fromtimestamp(ts_ns / 1e9)
         msg = {
             "role": role,
             "content": content,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now.isoformat(),
+            "ts_ns": ts_ns,  # Epoch time; unlike the local timestamp, unaffected by DST
             **kwargs
         }
         self.messages.append(msg)
-        self.updated_at = datetime.now()
+        self.updated_at = now
     
     @staticmethod
     def _is_context_anchor(message: dict[str, Any]) -> bool:
         """Return True when a message should count toward history window size."""
         role = message.get("role")
-        if role == "user":
-            return True
-        if role != "assistant":
-            return False
-        return not message.get("tool_calls")
+        return role == "user" or (role == "assistant" and not message.get("tool_calls"))
+
+    def _sync_anchor_index(self) -> list[int]:
+        """
+        Return positions of context anchors in messages, indexing only new messages.
+
+        The index is rebuilt if the messages list was replaced or shrank.
+        """
+        messages = self.messages
+        if messages is not self._indexed_messages or self._indexed_count > len(messages):
+            self._indexed_messages = messages
+            self._anchor_indices = []
+            self._anchor_times = []
+            self._anchor_times_sorted = True
+            self._indexed_count = 0
+
+        if self._indexed_count < len(messages):
+            is_anchor = self._is_context_anchor
+            indices = self._anchor_indices
+            times = self._anchor_times
+            for i in range(self._indexed_count, len(messages)):
+                m = messages[i]
+                if is_anchor(m):
+                    t = _message_time_ns(m)
+                    if times and t < times[-1]:
+                        self._anchor_times_sorted = False
+                    indices.append(i)
+                    times.append(t)
+            self._indexed_count = len(messages)
+        return self._anchor_indices
 
     def count_context_messages(self) -> int:
         """Count user/final-assistant messages used for history windowing."""
-        return sum(1 for m in self.messages if self._is_context_anchor(m))
-
+        return len(self._sync_anchor_index())
 
     def get_keep_tail_start_index(self, keep_context_messages: int) -> int:
         """Return the index where the last N context messages begin (including related tool messages)."""
         if keep_context_messages <= 0:
             return len(self.messages)
 
-        anchors_seen = 0
-        for idx in range(len(self.messages) - 1, -1, -1):
-            if self._is_context_anchor(self.messages[idx]):
-                anchors_seen += 1
-                if anchors_seen >= keep_context_messages:
-                    return idx
-        return 0
+        anchors = self._sync_anchor_index()
+        return anchors[-keep_context_messages] if len(anchors) >= keep_context_messages else 0
 
     def get_history(self, max_messages: int = 500) -> list[dict[str, Any]]:
         """Get recent messages in LLM format, preserving message metadata."""
         if max_messages <= 0:
             return []
+        return self._history_from(self.get_keep_tail_start_index(max_messages))
 
-        selected: list[dict[str, Any]] = []
-        anchors_seen = 0
-        for m in reversed(self.messages):
-            selected.append(m)
-            if self._is_context_anchor(m):
-                anchors_seen += 1
-                if anchors_seen >= max_messages:
-                    break
+    def get_history_since(self, since: datetime) -> list[dict[str, Any]]:
+        """
+        Get messages in LLM format starting at the first context message at or after `since`.
 
+        A naive `since` is taken as local time. Messages are compared by epoch
+        time, so DST changes do not matter; if the wall clock was ever set back
+        and times are out of order, this falls back to a linear scan.
+        """
+        anchors = self._sync_anchor_index()
+        times = self._anchor_times
+        cutoff = _epoch_ns(since)
+        if self._anchor_times_sorted:
+            pos = bisect_left(times, cutoff)
+        else:
+            pos = next((i for i, t in enumerate(times) if t >= cutoff), len(times))
+        if pos == len(anchors):
+            return []
+        return self._history_from(anchors[pos])
+
+    def _history_from(self, start: int) -> list[dict[str, Any]]:
+        """Convert messages from `start` onward to LLM format."""
+        keys = _HISTORY_KEYS
         out: list[dict[str, Any]] = []
-        for m in reversed(selected):
-            entry: dict[str, Any] = {"role": m["role"], "content": m.get("content", "")}
-            for k in ("tool_calls", "tool_call_id", "name", "reasoning_content"):
-                if k in m:
-                    entry[k] = m[k]
+        for m in self.messages[start:]:
+            entry = {k: m[k] for k in keys if k in m}
+            entry.setdefault("content", "")
             out.append(entry)
         return out
     
+    def _has_unsaved_changes(self) -> bool:
+        """Return True if messages were added or cleared since the last save."""
+        # A cleared session has nothing saved yet but still needs its file truncated
+        return len(self.messages) != self._saved_count or (self._rewrite and self._saved_count == 0)
+
     def clear(self) -> None:
         """Clear all messages and reset session to initial state."""
         self.messages = []
         self.last_consolidated = 0
+        self._saved_count = 0
+        self._rewrite = True
         self.updated_at = datetime.now()
 
 
@@ -103,24 +195,36 @@ class SessionManager:
     """
     Manages conversation sessions.
 
-    Sessions are stored as JSONL files in the sessions directory.
+    Sessions are stored as JSONL files in the sessions directory, one message
+    per line, with session metadata in a small `{key}.meta.json` sidecar so new
+    messages can be appended without rewriting the whole file.
     """
 
-    def __init__(self, workspace: Path):
+    def __init__(self, workspace: Path, max_cached_sessions: int = 128, sync_batch: int = 0):
         self.workspace = workspace
         self.sessions_dir = ensure_dir(self.workspace / "sessions")
         self.legacy_sessions_dir = Path.home() / ".nanobot" / "sessions"
-        self._cache: dict[str, Session] = {}
+        self._has_legacy_sessions = self.legacy_sessions_dir.is_dir()
+        self.max_cached_sessions = max_cached_sessions
+        # Opt-in group commit: fsync a session file after this many messages (0 = only on flush()).
+        # The sync blocks the caller, which is usually the event loop.
+        self.sync_batch = sync_batch
+        self._cache: OrderedDict[str, Session] = OrderedDict()
+        # Session file -> ((metadata source, mtime_ns, size), listing info)
+        self._info_cache: dict[Path, tuple[tuple[Path, int, int], dict[str, Any] | None]] = {}
+        self._unsynced: dict[Path, int] = {}  # Session file -> messages written since its last fsync
     
     def _get_session_path(self, key: str) -> Path:
         """Get the file path for a session."""
-        safe_key = safe_filename(key.replace(":", "_"))
-        return self.sessions_dir / f"{safe_key}.jsonl"
+        return _session_paths(self.sessions_dir, key)[0]
+
+    def _get_meta_path(self, key: str) -> Path:
+        """Get the metadata sidecar path for a session."""
+        return _session_paths(self.sessions_dir, key)[1]
 
     def _get_legacy_session_path(self, key: str) -> Path:
         """Legacy global session path (~/.nanobot/sessions/)."""
-        safe_key = safe_filename(key.replace(":", "_"))
-        return self.legacy_sessions_dir / f"{safe_key}.jsonl"
+        return _session_paths(self.legacy_sessions_dir, key)[0]
     
     def get_or_create(self, key: str) -> Session:
         """
@@ -133,87 +237,231 @@ class SessionManager:
             The session.
         """
         if key in self._cache:
+            self._cache.move_to_end(key)
             return self._cache[key]
         
         session = self._load(key)
         if session is None:
             session = Session(key=key)
         
-        self._cache[key] = session
+        self._remember(session)
         return session
+
+    def _remember(self, session: Session) -> None:
+        """Cache a session as most recently used, evicting the coldest beyond capacity."""
+        self._cache[session.key] = session
+        self._cache.move_to_end(session.key)
+        while len(self._cache) > self.max_cached_sessions:
+            key, evicted = self._cache.popitem(last=False)
+            if not evicted._has_unsaved_changes():
+                continue
+            try:
+                self._write(evicted)
+            except OSError as e:
+                logger.warning(f"Failed to save evicted session {key}: {e}")
     
     def _load(self, key: str) -> Session | None:
         """Load a session from disk."""
         path = self._get_session_path(key)
-        if not path.exists():
-            legacy_path = self._get_legacy_session_path(key)
-            if legacy_path.exists():
-                import shutil
-                shutil.move(str(legacy_path), str(path))
-                logger.info(f"Migrated session {key} from legacy path")
-
-        if not path.exists():
-            return None
-
         try:
+            f = self._open_session_file(key, path)
+            if f is None:
+                return None
+
             messages = []
-            metadata = {}
-            created_at = None
-            updated_at = None
-            last_consolidated = 0
-            needs_normalize_save = False
+            meta = None
+            has_escapes = False
+            line = b"\n"
 
-            with open(path, encoding="utf-8") as f:
+            # Parse line by line so only one raw line is held alongside the decoded messages
+            with f:
                 for line in f:
-                    if "\\u" in line:
-                        needs_normalize_save = True
-                    line = line.strip()
-                    if not line:
+                    # orjson accepts the trailing newline, so avoid a strip() copy per line
+                    if line.isspace():
                         continue
 
-                    data = json.loads(line)
+                    data = orjson.loads(line)
 
                     if data.get("_type") == "metadata":
-                        metadata = data.get("metadata", {})
-                        created_at = datetime.fromisoformat(data["created_at"]) if data.get("created_at") else None
-                        updated_at = datetime.fromisoformat(data["updated_at"]) if data.get("updated_at") else None
-                        last_consolidated = data.get("last_consolidated", 0)
+                        # Legacy layout: metadata header as the first line
+                        meta = data
                     else:
                         messages.append(data)
+                    if meta is not None and not has_escapes:
+                        has_escapes = b"\\u" in line
+                file_size = f.tell()
+
+            legacy_layout = meta is not None
+            if not legacy_layout:
+                try:
+                    meta = orjson.loads(self._get_meta_path(key).read_bytes())
+                except FileNotFoundError:
+                    pass
+                except (orjson.JSONDecodeError, OSError) as e:
+                    # Messages are intact in the JSONL file; load them with default metadata
+                    logger.warning(f"Ignoring unreadable metadata for session {key}: {e}")
+            if not isinstance(meta, dict):
+                meta = {}
 
             session = Session(
                 key=key,
                 messages=messages,
-                created_at=created_at or datetime.now(),
-                updated_at=updated_at or datetime.now(),
-                metadata=metadata,
-                last_consolidated=last_consolidated
+                created_at=datetime.fromisoformat(meta["created_at"]) if meta.get("created_at") else datetime.now(),
+                updated_at=datetime.fromisoformat(meta["updated_at"]) if meta.get("updated_at") else datetime.now(),
+                metadata=meta.get("metadata", {}),
+                last_consolidated=meta.get("last_consolidated", 0)
             )
-            if needs_normalize_save:
+            session._saved_count = len(messages)
+            session._saved_size = file_size
+            # Appending is only safe to the sidecar layout after a newline-terminated last line
+            session._rewrite = legacy_layout or not line.endswith(b"\n")
+            if has_escapes:
+                # Legacy files were written with ensure_ascii, escaping non-ASCII text
+                # as \uXXXX. Files in the sidecar layout come from orjson, so any \u
+                # left there is a real escape and rewriting would change nothing.
                 self.save(session)
             return session
         except Exception as e:
             logger.warning(f"Failed to load session {key}: {e}")
             return None
     
+    def _open_session_file(self, key: str, path: Path) -> BinaryIO | None:
+        """Open a session file for reading, migrating it from the legacy path on a miss."""
+        try:
+            return open(path, "rb")
+        except FileNotFoundError:
+            if not self._migrate_legacy_session(key, path):
+                return None
+        return open(path, "rb")
+
+    def _migrate_legacy_session(self, key: str, path: Path) -> bool:
+        """Move a session from the legacy global directory to `path`. Returns False if there is none."""
+        if not self._has_legacy_sessions:
+            return False
+        try:
+            shutil.move(str(self._get_legacy_session_path(key)), str(path))
+        except FileNotFoundError:
+            return False
+        logger.info(f"Migrated session {key} from legacy path")
+        return True
+
     def save(self, session: Session) -> None:
-        """Save a session to disk."""
+        """
+        Save a session to disk.
+
+        Only messages added since the last save are appended. The file is
+        rewritten in full only after clear(), for sessions loaded from the
+        legacy layout, or when the file lacks a trailing newline.
+
+        A session object that is no longer the cached instance for its key
+        (evicted or invalidated, then reloaded) only has its new messages
+        appended; its metadata is not written and it is not re-cached, so a
+        stale copy cannot overwrite what was saved through the current one.
+        """
+        cached = self._cache.get(session.key)
+        if cached is not None and cached is not session:
+            self._write_stale(session)
+            return
+        self._write(session)
+        self._remember(session)
+
+    def _write_stale(self, session: Session) -> None:
+        """Append a stale session's pending messages, leaving metadata and the cache alone."""
         path = self._get_session_path(session.key)
+        written = self._append_messages(path, session)
+        if written is None:
+            logger.warning(f"Not rewriting stale session {session.key}: a newer copy is loaded")
+            return
+        self._track_unsynced(path, written)
+        if written:
+            # The cached copy no longer matches the file; reload it on next access
+            self.invalidate(session.key)
 
-        with open(path, "w", encoding="utf-8") as f:
-            metadata_line = {
-                "_type": "metadata",
-                "created_at": session.created_at.isoformat(),
-                "updated_at": session.updated_at.isoformat(),
-                "metadata": session.metadata,
-                "last_consolidated": session.last_consolidated
-            }
-            f.write(json.dumps(metadata_line, ensure_ascii=False) + "\n")
-            for msg in session.messages:
-                f.write(json.dumps(msg, ensure_ascii=False) + "\n")
+    def _write(self, session: Session) -> None:
+        """Persist a session's messages and metadata sidecar."""
+        path = self._get_session_path(session.key)
+        written = self._append_messages(path, session)
+        if written is None:
+            self._write_messages(path, session)
+            written = len(session.messages)
 
-        self._cache[session.key] = session
+        self._track_unsynced(path, written)
+
+        meta = {
+            "key": session.key,
+            "created_at": session.created_at.isoformat(),
+            "updated_at": session.updated_at.isoformat(),
+            "metadata": session.metadata,
+            "last_consolidated": session.last_consolidated
+        }
+        # Write then rename so a crash never leaves a truncated sidecar behind
+        meta_path = self._get_meta_path(session.key)
+        tmp_path = meta_path.with_name(f"{meta_path.name}.tmp")
+        tmp_path.write_bytes(orjson.dumps(meta))
+        os.replace(tmp_path, meta_path)
+
+    @staticmethod
+    def _append_messages(path: Path, session: Session) -> int | None:
+        """
+        Append unsaved messages to the session file.
+
+        Returns the number of messages written, or None if the file must be
+        rewritten instead (after clear(), or for a legacy or unterminated file).
+        """
+        saved = session._saved_count
+        if session._rewrite or saved > len(session.messages):
+            return None
+
+        with open(path, "ab") as f:
+            size = f.tell()
+            if size == 0:
+                # Missing or empty file: nothing to preserve, write everything we have
+                pending = session.messages
+            else:
+                if size != session._saved_size:
+                    # Someone else wrote to the file; append rather than truncate their data
+                    logger.warning(
+                        f"Session file {path} changed since it was last saved ({size} bytes, "
+                        f"expected {session._saved_size}); appending without rewriting"
+                    )
+                pending = session.messages[saved:]
+            f.write(_encode_lines(pending))
+            session._saved_size = f.tell()
+        session._saved_count = len(session.messages)
+        return len(pending)
+
+    @staticmethod
+    def _write_messages(path: Path, session: Session) -> None:
+        """Rewrite the whole session file."""
+        data = _encode_lines(session.messages)
+        with open(path, "wb") as f:
+            f.write(data)
+            session._saved_size = f.tell()
+        session._saved_count = len(session.messages)
+        session._rewrite = False
     
+    def _track_unsynced(self, path: Path, written: int) -> None:
+        """Record messages written to a session file, syncing it once a batch has accumulated."""
+        unsynced = self._unsynced.get(path, 0) + written
+        if self.sync_batch and unsynced >= self.sync_batch:
+            self._sync_file(path)
+        else:
+            self._unsynced[path] = unsynced
+
+    def _sync_file(self, path: Path) -> None:
+        """Flush a session file to stable storage."""
+        self._unsynced.pop(path, None)
+        with open(path, "ab") as f:
+            _fdatasync(f.fileno())
+
+    def flush(self) -> None:
+        """Sync every session file written since its last fsync."""
+        for path in list(self._unsynced):
+            try:
+                self._sync_file(path)
+            except OSError as e:
+                logger.warning(f"Failed to sync session file {path}: {e}")
+
     def invalidate(self, key: str) -> None:
         """Remove a session from the in-memory cache."""
         self._cache.pop(key, None)
@@ -225,23 +473,51 @@ class SessionManager:
         Returns:
             List of session info dicts.
         """
-        sessions = []
+        with os.scandir(self.sessions_dir) as it:
+            paths = [Path(entry.path) for entry in it if entry.name.endswith(".jsonl")]
+        # Each read is a tiny file, so the listing is bound by IO latency, not CPU
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            sessions = [info for info in pool.map(self._read_session_info, paths) if info]
+        for stale in self._info_cache.keys() - set(paths):
+            del self._info_cache[stale]
         
-        for path in self.sessions_dir.glob("*.jsonl"):
+        return sorted(sessions, key=lambda x: x.get("updated_at") or "", reverse=True)
+
+    def _read_session_info(self, path: Path) -> dict[str, Any] | None:
+        """Read listing info for a session file, reusing the last result while its metadata source is unchanged."""
+        try:
+            source = path.with_name(f"{path.stem}.meta.json")
             try:
-                # Read just the metadata line
-                with open(path, encoding="utf-8") as f:
+                st = source.stat()
+            except FileNotFoundError:
+                # Legacy layout: metadata lives in the first line of the session file
+                source = path
+                st = source.stat()
+
+            # Size guards against rewrites within one tick on coarse-timestamp filesystems
+            stamp = (source, st.st_mtime_ns, st.st_size)
+            cached = self._info_cache.get(path)
+            if cached and cached[0] == stamp:
+                return cached[1]
+
+            if source is path:
+                with open(path, "rb") as f:
                     first_line = f.readline().strip()
-                    if first_line:
-                        data = json.loads(first_line)
-                        if data.get("_type") == "metadata":
-                            sessions.append({
-                                "key": path.stem.replace("_", ":"),
-                                "created_at": data.get("created_at"),
-                                "updated_at": data.get("updated_at"),
-                                "path": str(path)
-                            })
-            except Exception:
-                continue
-        
-        return sorted(sessions, key=lambda x: x.get("updated_at", ""), reverse=True)
+                data = orjson.loads(first_line) if first_line else {}
+                if data.get("_type") != "metadata":
+                    data = None
+            else:
+                data = orjson.loads(source.read_bytes())
+
+            info = None
+            if data is not None:
+                info = {
+                    "key": data.get("key") or path.stem.replace("_", ":"),
+                    "created_at": data.get("created_at"),
+                    "updated_at": data.get("updated_at"),
+                    "path": str(path)
+                }
+            self._info_cache[path] = (stamp, info)
+            return info
+        except Exception:
+            return None
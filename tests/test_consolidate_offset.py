@@ -118,6 +118,98 @@ class TestSessionImmutableHistory:
         assert len(history) == 5
         assert history[0]["content"] == "msg0"
 
+    def test_context_window_tracks_message_changes(self) -> None:
+        """Test that anchor counting follows appended, cleared and replaced messages."""
+        session = Session(key="test:anchors")
+        session.add_message("user", "q1")
+        session.add_message("assistant", "", tool_calls=[{"id": "1"}])
+        session.add_message("tool", "result", tool_call_id="1")
+        session.add_message("assistant", "a1")
+        assert session.count_context_messages() == 2
+        assert session.get_keep_tail_start_index(1) == 3
+        assert [m["content"] for m in session.get_history(max_messages=2)] == ["q1", "", "result", "a1"]
+
+        session.add_message("user", "q2")
+        assert session.count_context_messages() == 3
+        assert session.get_history(max_messages=1) == [{"role": "user", "content": "q2"}]
+
+        session.clear()
+        assert session.count_context_messages() == 0
+
+        session.messages = [{"role": "user", "content": "x"}]
+        assert session.count_context_messages() == 1
+
+    def test_get_history_defaults_missing_content(self) -> None:
+        """Test that history entries keep role first and default missing content to ''."""
+        session = Session(key="test:no_content")
+        session.messages = [{"role": "user", "tool_call_id": "1", "timestamp": "2026-01-01T00:00:00"}]
+
+        history = session.get_history()
+        assert history == [{"role": "user", "tool_call_id": "1", "content": ""}]
+        assert next(iter(history[0])) == "role"
+
+    def test_get_history_since_timestamp(self) -> None:
+        """Test that get_history_since starts at the first context message at or after the cutoff."""
+        from datetime import datetime
+
+        session = Session(key="test:since")
+        session.messages = [
+            {"role": "user", "content": "old", "timestamp": "2026-01-01T09:00:00"},
+            {"role": "assistant", "content": "", "tool_calls": [{"id": "1"}], "timestamp": "2026-01-01T10:00:00"},
+            {"role": "tool", "content": "result", "tool_call_id": "1", "timestamp": "2026-01-01T10:00:00.500000"},
+            {"role": "assistant", "content": "new", "timestamp": "2026-01-01T10:00:01"},
+        ]
+
+        history = session.get_history_since(datetime(2026, 1, 1, 10))
+        assert [m["content"] for m in history] == ["new"]
+        assert len(session.get_history_since(datetime(2026, 1, 1, 9))) == 4
+        assert session.get_history_since(datetime(2026, 1, 2)) == []
+
+    def test_get_history_since_accepts_aware_datetime(self) -> None:
+        """Test that an aware cutoff is compared in local time, not as a suffixed string."""
+        from datetime import datetime, timedelta, timezone
+
+        since = datetime(2026, 1, 1, 10, tzinfo=timezone(timedelta(hours=5)))
+        local = since.astimezone().replace(tzinfo=None)
+        session = Session(key="test:since_aware")
+        session.messages = [
+            {"role": "user", "content": "before", "timestamp": (local - timedelta(seconds=1)).isoformat()},
+            {"role": "user", "content": "after", "timestamp": (local + timedelta(seconds=1)).isoformat()},
+        ]
+
+        assert [m["content"] for m in session.get_history_since(since)] == ["after"]
+
+    def test_get_history_since_uses_epoch_time(self) -> None:
+        """Test that local timestamps going backwards (DST fall-back) do not break the window."""
+        from datetime import datetime
+
+        base = 1_800_000_000 * 10**9
+        session = Session(key="test:since_dst")
+        session.messages = [
+            {"role": "user", "content": "first", "timestamp": "2026-11-01T01:50:00", "ts_ns": base},
+            {"role": "user", "content": "second", "timestamp": "2026-11-01T01:10:00", "ts_ns": base + 1_200 * 10**9},
+            {"role": "user", "content": "third", "timestamp": "2026-11-01T01:20:00", "ts_ns": base + 1_800 * 10**9},
+        ]
+
+        since = datetime.fromtimestamp(base / 1e9 + 1_000)
+        assert [m["content"] for m in session.get_history_since(since)] == ["second", "third"]
+
+    def test_get_history_since_handles_clock_set_back(self) -> None:
+        """Test that out-of-order message times fall back to a linear scan."""
+        from datetime import datetime
+
+        base = 1_800_000_000 * 10**9
+        session = Session(key="test:since_unsorted")
+        session.messages = [
+            {"role": "user", "content": "a", "ts_ns": base},
+            {"role": "user", "content": "b", "ts_ns": base + 200 * 10**9},
+            {"role": "user", "content": "c", "ts_ns": base + 50 * 10**9},
+            {"role": "user", "content": "d", "ts_ns": base + 100 * 10**9},
+        ]
+
+        since = datetime.fromtimestamp(base / 1e9 + 150)
+        assert [m["content"] for m in session.get_history_since(since)] == ["b", "c", "d"]
+
     def test_get_history_stable_for_same_session(self) -> None:
         """Test that get_history returns same content for same max_messages."""
         session = create_session_with_messages("test:stable", 20)
@@ -196,6 +288,267 @@ class TestSessionPersistence:
         assert "天气很好" in raw
         assert "\\u5929" not in raw
 
+    def test_unreadable_session_file_starts_empty(self, temp_manager):
+        """Test that an unopenable session path is logged and treated as a new session."""
+        (Path(temp_manager.sessions_dir) / "test_dir.jsonl").mkdir()
+
+        session = temp_manager.get_or_create("test:dir")
+        assert session.messages == []
+
+    def test_load_skips_blank_lines(self, temp_manager):
+        """Test that blank and CRLF-terminated lines in a session file are tolerated."""
+        session_file = Path(temp_manager.sessions_dir) / "test_blank.jsonl"
+        session_file.write_bytes(b'{"role":"user","content":"a"}\r\n\n  \n{"role":"assistant","content":"b"}')
+
+        session = temp_manager.get_or_create("test:blank")
+        assert [m["content"] for m in session.messages] == ["a", "b"]
+
+        session.add_message("user", "c")
+        temp_manager.save(session)
+        temp_manager.invalidate("test:blank")
+        assert [m["content"] for m in temp_manager.get_or_create("test:blank").messages] == ["a", "b", "c"]
+
+    def test_load_does_not_rewrite_current_layout(self, temp_manager, monkeypatch):
+        """Test that a literal backslash-u in an up-to-date file does not trigger a rewrite on load."""
+        session = Session(key="test:backslash")
+        session.add_message("user", "C:\\users\\me and \x01")
+        temp_manager.save(session)
+        temp_manager.invalidate("test:backslash")
+
+        writes = []
+        monkeypatch.setattr(temp_manager, "_write", lambda s: writes.append(s.key))
+        loaded = temp_manager.get_or_create("test:backslash")
+        assert loaded.messages[0]["content"] == "C:\\users\\me and \x01"
+        assert writes == []
+
+    def test_save_appends_only_new_messages(self, temp_manager):
+        """Test that repeated saves append new messages instead of rewriting the file."""
+        session = create_session_with_messages("test:append", 3)
+        temp_manager.save(session)
+
+        session_file = Path(temp_manager.sessions_dir) / "test_append.jsonl"
+        before = session_file.read_bytes()
+
+        session.add_message("assistant", "resp")
+        session.last_consolidated = 2
+        temp_manager.save(session)
+
+        after = session_file.read_bytes()
+        assert after.startswith(before)
+        assert after.count(b"\n") == 4
+
+        temp_manager.invalidate("test:append")
+        reloaded = temp_manager.get_or_create("test:append")
+        assert [m["content"] for m in reloaded.messages] == ["msg0", "msg1", "msg2", "resp"]
+        assert reloaded.last_consolidated == 2
+
+    def test_save_does_not_truncate_other_writers(self, temp_manager):
+        """Test that a file grown by another writer is appended to, not rewritten."""
+        session = create_session_with_messages("test:shared", 1)
+        temp_manager.save(session)
+
+        other_manager = SessionManager(temp_manager.workspace)
+        other = other_manager.get_or_create("test:shared")
+        other.add_message("user", "from-other")
+        other_manager.save(other)
+
+        session.add_message("user", "from-first")
+        temp_manager.save(session)
+
+        reloaded = SessionManager(temp_manager.workspace).get_or_create("test:shared")
+        assert [m["content"] for m in reloaded.messages] == ["msg0", "from-other", "from-first"]
+
+    @pytest.mark.parametrize("sidecar", [b"", b'{"key": "test:corrupt", "crea'])
+    def test_load_survives_unreadable_sidecar(self, temp_manager, sidecar):
+        """Test that an empty or truncated metadata sidecar does not drop the messages."""
+        session = create_session_with_messages("test:corrupt", 3)
+        session.metadata["a"] = 1
+        temp_manager.save(session)
+        temp_manager.invalidate("test:corrupt")
+
+        meta_file = Path(temp_manager.sessions_dir) / "test_corrupt.meta.json"
+        meta_file.write_bytes(sidecar)
+
+        reloaded = temp_manager.get_or_create("test:corrupt")
+        assert [m["content"] for m in reloaded.messages] == ["msg0", "msg1", "msg2"]
+        assert reloaded.metadata == {}
+
+        reloaded.add_message("user", "msg3")
+        temp_manager.save(reloaded)
+        assert not list(Path(temp_manager.sessions_dir).glob("*.tmp"))
+        temp_manager.invalidate("test:corrupt")
+        assert len(temp_manager.get_or_create("test:corrupt").messages) == 4
+
+    def test_save_rewrites_after_clear(self, temp_manager):
+        """Test that saving a cleared session truncates the file."""
+        session = create_session_with_messages("test:rewrite", 5)
+        temp_manager.save(session)
+        session.clear()
+        session.add_message("user", "fresh")
+        temp_manager.save(session)
+
+        temp_manager.invalidate("test:rewrite")
+        reloaded = temp_manager.get_or_create("test:rewrite")
+        assert [m["content"] for m in reloaded.messages] == ["fresh"]
+
+    def test_legacy_metadata_header_migrates_to_sidecar(self, temp_manager):
+        """Test that a legacy metadata header is moved into the sidecar on next save."""
+        session_file = Path(temp_manager.sessions_dir) / "test_legacy_header.jsonl"
+        session_file.write_text(
+            '{"_type":"metadata","created_at":"2026-01-01T00:00:00","updated_at":"2026-01-01T00:00:00","metadata":{"a":1},"last_consolidated":1}\n'
+            '{"role":"user","content":"hello"}\n',
+            encoding="utf-8",
+        )
+
+        session = temp_manager.get_or_create("test:legacy_header")
+        assert session.metadata == {"a": 1}
+        assert session.last_consolidated == 1
+
+        session.add_message("assistant", "hi")
+        temp_manager.save(session)
+        assert "_type" not in session_file.read_text(encoding="utf-8")
+
+        temp_manager.invalidate("test:legacy_header")
+        reloaded = temp_manager.get_or_create("test:legacy_header")
+        assert [m["content"] for m in reloaded.messages] == ["hello", "hi"]
+        assert reloaded.metadata == {"a": 1}
+        assert [s["key"] for s in temp_manager.list_sessions()] == ["test:legacy_header"]
+
+    def test_load_migrates_legacy_global_session(self, tmp_path, monkeypatch):
+        """Test that a session under ~/.nanobot/sessions is moved into the workspace on load."""
+        home = tmp_path / "home"
+        legacy_dir = home / ".nanobot" / "sessions"
+        legacy_dir.mkdir(parents=True)
+        (legacy_dir / "test_migrate.jsonl").write_text('{"role":"user","content":"hi"}\n', encoding="utf-8")
+        monkeypatch.setattr(Path, "home", lambda: home)
+
+        manager = SessionManager(tmp_path / "workspace")
+        assert manager.get_or_create("test:migrate").messages[0]["content"] == "hi"
+        assert (manager.sessions_dir / "test_migrate.jsonl").exists()
+        assert not (legacy_dir / "test_migrate.jsonl").exists()
+        assert manager.get_or_create("test:missing").messages == []
+
+    def test_save_syncs_in_batches_when_enabled(self, tmp_path, monkeypatch):
+        """Test that session files are fsynced once per batch of messages and on flush()."""
+        import nanobot.session.manager as manager_module
+
+        synced = []
+        monkeypatch.setattr(manager_module, "_fdatasync", synced.append)
+        manager = SessionManager(Path(tmp_path), sync_batch=4)
+        session = Session(key="test:sync")
+        for i in range(5):
+            session.add_message("user", f"msg{i}")
+            manager.save(session)
+        assert len(synced) == 1
+
+        manager.flush()
+        assert len(synced) == 2
+        manager.flush()
+        assert len(synced) == 2
+
+    def test_save_does_not_sync_by_default(self, temp_manager, monkeypatch):
+        """Test that saves never fsync unless group commit is enabled; flush() still does."""
+        import nanobot.session.manager as manager_module
+
+        synced = []
+        monkeypatch.setattr(manager_module, "_fdatasync", synced.append)
+        session = Session(key="test:nosync")
+        for i in range(100):
+            session.add_message("user", f"msg{i}")
+            temp_manager.save(session)
+        assert synced == []
+
+        temp_manager.flush()
+        assert len(synced) == 1
+
+    def test_cache_evicts_least_recently_used(self, tmp_path):
+        """Test that the session cache is bounded and persists evicted sessions."""
+        manager = SessionManager(Path(tmp_path), max_cached_sessions=2)
+        a = manager.get_or_create("test:a")
+        a.add_message("user", "unsaved")
+        manager.get_or_create("test:b")
+        manager.get_or_create("test:a")
+        manager.get_or_create("test:c")
+
+        assert list(manager._cache) == ["test:a", "test:c"]
+
+        manager.get_or_create("test:d")
+        assert "test:a" not in manager._cache
+        assert manager.get_or_create("test:a").messages[0]["content"] == "unsaved"
+
+    def test_list_sessions_reflects_latest_save(self, temp_manager):
+        """Test that list_sessions is ordered by update time and picks up new saves."""
+        from datetime import datetime
+
+        older = Session(key="test:older", updated_at=datetime(2026, 1, 1))
+        newer = Session(key="test:newer", updated_at=datetime(2026, 1, 2))
+        temp_manager.save(older)
+        temp_manager.save(newer)
+        assert [s["key"] for s in temp_manager.list_sessions()] == ["test:newer", "test:older"]
+
+        older.updated_at = datetime(2026, 1, 3)
+        temp_manager.save(older)
+        assert [s["key"] for s in temp_manager.list_sessions()] == ["test:older", "test:newer"]
+
+    def test_stale_session_save_after_eviction_keeps_newer_messages(self, tmp_path):
+        """Test that saving an evicted session object appends its messages without clobbering the reloaded copy."""
+        manager = SessionManager(Path(tmp_path), max_cached_sessions=1)
+        stale = manager.get_or_create("test:a")
+        stale.add_message("user", "m1")
+        manager.save(stale)
+
+        manager.get_or_create("test:other")
+        current = manager.get_or_create("test:a")
+        assert current is not stale
+        current.add_message("user", "m2-from-current")
+        manager.save(current)
+
+        stale.add_message("assistant", "turn reply")
+        stale.last_consolidated = 1
+        manager.save(stale)
+
+        expected = ["m1", "m2-from-current", "turn reply"]
+        refreshed = manager.get_or_create("test:a")
+        assert refreshed is not stale and refreshed is not current
+        assert [m["content"] for m in refreshed.messages] == expected
+        reloaded = SessionManager(Path(tmp_path)).get_or_create("test:a")
+        assert [m["content"] for m in reloaded.messages] == expected
+        assert reloaded.last_consolidated == 0
+
+    def test_eviction_does_not_write_unsaved_lookups(self, tmp_path):
+        """Test that evicting a session that was only looked up leaves nothing on disk."""
+        manager = SessionManager(Path(tmp_path), max_cached_sessions=1)
+        manager.get_or_create("test:x")
+        manager.get_or_create("test:y")
+
+        assert list(manager.sessions_dir.iterdir()) == []
+        assert manager.list_sessions() == []
+
+    def test_list_sessions_ignores_mtime_only_cache_hits(self, temp_manager):
+        """Test that a metadata rewrite is picked up even when the mtime did not change."""
+        import os
+        from datetime import datetime
+
+        session = Session(key="test:coarse", updated_at=datetime(2026, 1, 1))
+        temp_manager.save(session)
+        meta_file = Path(temp_manager.sessions_dir) / "test_coarse.meta.json"
+        mtime = meta_file.stat().st_mtime_ns
+        assert temp_manager.list_sessions()[0]["updated_at"] == "2026-01-01T00:00:00"
+
+        session.updated_at = datetime(2026, 1, 2, 3, 4, 5, 678901)
+        temp_manager.save(session)
+        os.utime(meta_file, ns=(mtime, mtime))
+        assert temp_manager.list_sessions()[0]["updated_at"] == "2026-01-02T03:04:05.678901"
+
+    def test_list_sessions_forgets_deleted_files(self, temp_manager):
+        """Test that listing info for removed session files is dropped from the cache."""
+        temp_manager.save(create_session_with_messages("test:gone", 1))
+        assert len(temp_manager.list_sessions()) == 1
+
+        (Path(temp_manager.sessions_dir) / "test_gone.jsonl").unlink()
+        assert temp_manager.list_sessions() == []
+        assert temp_manager._info_cache == {}
+
     def test_clear_resets_session(self, temp_manager):
         """Test that clear() properly resets session."""
         session = create_session_with_messages("test:clear", 10)